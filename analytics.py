@@ -0,0 +1,149 @@
+import numpy as np
+
+# --group-byで指定できる項目と対応するフィールド
+GROUP_FIELDS = {
+    'member': 'office_member_id',
+    'dept': 'dept_id',
+    'item': 'ex_item_id',
+    'project': 'project_id',
+}
+
+def _encode(values):
+    """値のリストをカテゴリ（出現順のユニーク値の配列）とコード（int32の配列）に変換"""
+    index = {}
+    codes = np.fromiter((index.setdefault(v or '', len(index)) for v in values), dtype=np.int32, count=len(values))
+    return np.array(list(index), dtype=object), codes
+
+class TransactionTable:
+    """経費明細の列指向テーブル
+
+    ID類はカテゴリ（ユニーク値）とコードに分けて保持し、集計はコードの配列に対してベクトル演算で行う。
+    """
+
+    def __init__(self, columns, categories, dates, values):
+        """
+        初期化
+
+        Args:
+            columns: 列名をキー、コード（int32の配列）を値とする辞書
+            categories: 列名をキー、カテゴリ（ユニーク値の配列）を値とする辞書
+            dates: 計上日（datetime64[D]の配列）
+            values: 金額（float64の配列）
+        """
+        self.columns = columns
+        self.categories = categories
+        self.dates = dates
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        経費明細データのリストからテーブルを作成
+
+        Args:
+            records: 経費明細データ（辞書または型付きモデル）のリスト
+
+        Returns:
+            TransactionTable
+        """
+        columns = {}
+        categories = {}
+        for field in GROUP_FIELDS.values():
+            categories[field], columns[field] = _encode([r.get(field) for r in records])
+        dates = np.array([r.get('recognized_at') or 'NaT' for r in records], dtype='datetime64[D]')
+        values = np.array([r.get('value') or 0 for r in records], dtype=np.float64)
+        return cls(columns, categories, dates, values)
+
+    def filter(self, mask):
+        """条件（真偽値の配列）に一致する行だけのテーブル"""
+        columns = {field: codes[mask] for field, codes in self.columns.items()}
+        return TransactionTable(columns, self.categories, self.dates[mask], self.values[mask])
+
+    def between(self, since=None, until=None):
+        """計上日がsince〜untilの行だけのテーブル"""
+        mask = ~np.isnat(self.dates)
+        if since:
+            mask &= self.dates >= np.datetime64(since, 'D')
+        if until:
+            mask &= self.dates <= np.datetime64(until, 'D')
+        return self.filter(mask)
+
+    def _group_column(self, key):
+        """グループ化する列のカテゴリとコード"""
+        if key == 'month':
+            months, codes = np.unique(self.dates.astype('datetime64[M]'), return_inverse=True)
+            return months.astype(str), codes
+        field = GROUP_FIELDS[key]
+        return self.categories[field], self.columns[field]
+
+    def outlier_mask(self, ex_item_id, expected_value):
+        """
+        テンプレートの金額と異なる明細の判定
+
+        Args:
+            ex_item_id: 対象の経費科目ID（交通費など）
+            expected_value: テンプレートの金額
+
+        Returns:
+            外れ値の行がTrueの配列
+        """
+        item_codes = np.flatnonzero(self.categories['ex_item_id'] == ex_item_id)
+        if len(item_codes) == 0:
+            return np.zeros(len(self), dtype=bool)
+        return (self.columns['ex_item_id'] == item_codes[0]) & (self.values != expected_value)
+
+    def summarize(self, group_by, outliers=None):
+        """
+        グループごとの合計・件数・外れ値件数を集計
+
+        Args:
+            group_by: グループ化する項目のリスト（member, dept, item, project, month）
+            outliers: 外れ値の行がTrueの配列（指定しない場合は外れ値を集計しない）
+
+        Returns:
+            グループごとの辞書のリスト（group_byの各項目、total、count、outliers）
+        """
+        if len(self) == 0:
+            return []
+
+        labels = []
+        codes = []
+        for key in group_by:
+            key_labels, key_codes = self._group_column(key)
+            labels.append(key_labels)
+            codes.append(key_codes)
+
+        # 各列のコードを1つのグループ番号にまとめて集計する
+        combined = np.ravel_multi_index(codes, [len(l) for l in labels]) if codes else np.zeros(len(self), dtype=np.int64)
+        groups, inverse = np.unique(combined, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.values)
+        counts = np.bincount(inverse)
+        outlier_counts = np.bincount(inverse, weights=outliers).astype(np.int64) if outliers is not None else None
+
+        group_codes = np.unravel_index(groups, [len(l) for l in labels]) if codes else []
+        rows = []
+        for i in range(len(groups)):
+            row = {key: str(labels[j][group_codes[j][i]]) for j, key in enumerate(group_by)}
+            row['total'] = float(totals[i])
+            row['count'] = int(counts[i])
+            if outlier_counts is not None:
+                row['outliers'] = int(outlier_counts[i])
+            rows.append(row)
+        rows.sort(key=lambda row: tuple(row[key] for key in group_by))
+        return rows
+
+def format_rows(rows, group_by):
+    """集計結果をタブ区切りの表形式の文字列に変換"""
+    headers = list(group_by) + ['total', 'count']
+    if rows and 'outliers' in rows[0]:
+        headers.append('outliers')
+    lines = ['\t'.join(headers)]
+    for row in rows:
+        lines.append('\t'.join(
+            f"{row[h]:.0f}" if h == 'total' else (str(row[h]) or '(なし)')
+            for h in headers
+        ))
+    return '\n'.join(lines)
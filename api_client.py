@@ -1,25 +1,209 @@
-import json
+import threading
+import time
 import requests
 from oauthlib.oauth2.rfc6749.errors import TokenExpiredError
+import json_codec
+import profiling
 from auth import MFAuth
-from config import MF_API_BASE_URL, MF_OFFICE_ID
+from config import MF_API_BASE_URL, MF_OFFICE_ID, MF_CACHE_TTL
+from models import ExTransaction, ExReport, ExReportType, Office
+
+class _InFlight:
+    """実行中のGETリクエスト（同一リクエストの待ち合わせ用）"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
 
 class MFExpenseClient:
     """MoneyForward Expense APIクライアント"""
     
-    def __init__(self, auth=None):
+    # GETレスポンスのキャッシュの最大件数（超えた場合は期限切れ、古い順に削除）
+    CACHE_MAX_ENTRIES = 1024
+    
+    def __init__(self, auth=None, office_id=None, typed=False, cache_ttl=None, coalesce=True):
         """
         初期化
         
         Args:
             auth: MFAuthインスタンス。指定しない場合は新規作成
+            office_id: 既定の事業者ID（指定しない場合は設定ファイルの値を使用）
+            typed: Trueの場合、レスポンスを辞書ではなく型付きモデル（models.py）で返す
+            cache_ttl: GETレスポンスをキャッシュする秒数（指定しない場合は設定ファイルの値、0で無効）
+            coalesce: Trueの場合、同時に実行された同一のGETリクエストを1回の通信にまとめる
         """
         self.auth = auth if auth else MFAuth()
         self.session = self.auth.get_session()
         self.base_url = MF_API_BASE_URL
-        self.office_id = MF_OFFICE_ID
+        self.office_id = office_id or MF_OFFICE_ID
+        self.typed = typed
+        self.cache_ttl = MF_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.coalesce = coalesce
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._cache = {}
+        self._generation = 0
+    
+    def _parse(self, model, payload):
+        """typedが有効な場合はレスポンスを型付きモデルに変換"""
+        if not self.typed:
+            return payload
+        return model.parse(payload)
     
-    def _request(self, method, endpoint, params=None, data=None, json_data=None, retry_count=0):
+    def _request(self, method, endpoint, params=None, data=None, json_data=None):
+        """
+        APIリクエストを送信
+        
+        GETリクエストは、同時に実行された同一のリクエストを1回の通信にまとめ、
+        cache_ttlが設定されていれば短時間キャッシュする。返り値は呼び出し元の間で共有されるため変更しないこと。
+        GET以外のリクエストは、同じリソースとその一覧のキャッシュを無効化する。
+        
+        Args:
+            method: HTTPメソッド
+            endpoint: エンドポイント
+            params: URLパラメータ
+            data: リクエストボディ（フォームデータ）
+            json_data: リクエストボディ（JSON）
+            
+        Returns:
+            レスポンスのJSONデータ
+        """
+        if method != "GET":
+            try:
+                return self._send(method, endpoint, params, data, json_data)
+            finally:
+                self._invalidate(method, endpoint)
+        
+        if not self.coalesce and not self.cache_ttl:
+            return self._send(method, endpoint, params, data, json_data)
+        
+        key = self._request_key(endpoint, params)
+        if key is None:
+            return self._send(method, endpoint, params, data, json_data)
+        
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                profiling.instant('cache_hit', 'api', endpoint=endpoint)
+                return cached[1]
+            call = self._inflight.get(key) if self.coalesce else None
+            if call is None:
+                call = _InFlight()
+                leader = True
+                generation = self._generation
+                if self.coalesce:
+                    self._inflight[key] = call
+            else:
+                leader = False
+        
+        if not leader:
+            with profiling.span('coalesced_wait', 'api', endpoint=endpoint):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = self._send(method, endpoint, params, data, json_data)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # 実行中に無効化された場合は、後続のリクエストが登録した別の呼び出しを消さない
+                if self._inflight.get(key) is call:
+                    del self._inflight[key]
+                # 実行中に更新・削除があった場合は古い可能性があるためキャッシュしない
+                if self.cache_ttl and call.error is None and generation == self._generation:
+                    self._store(key, call.result)
+            call.done.set()
+    
+    @staticmethod
+    def _request_key(endpoint, params):
+        """
+        GETリクエストを識別するキー（まとめ送信・キャッシュ用）
+        
+        リスト値のパラメータ（ids[]=a&ids[]=b等）はタプルに変換する。
+        キーにできないパラメータ（ネストした辞書等）の場合はNoneを返す。
+        """
+        items = []
+        for name, value in (params or {}).items():
+            if isinstance(value, list):
+                value = tuple(value)
+            items.append((name, value))
+        try:
+            key = (endpoint, tuple(sorted(items)))
+            hash(key)
+        except TypeError:
+            return None
+        return key
+    
+    def _store(self, key, result):
+        """GETレスポンスをキャッシュ（_lockを保持して呼び出す）"""
+        now = time.monotonic()
+        self._cache.pop(key, None)
+        if len(self._cache) >= self.CACHE_MAX_ENTRIES:
+            for cached_key, (expires, _) in list(self._cache.items()):
+                if expires <= now:
+                    del self._cache[cached_key]
+            # 期限切れがなければ最も古いものから削除
+            while len(self._cache) >= self.CACHE_MAX_ENTRIES:
+                del self._cache[next(iter(self._cache))]
+        self._cache[key] = (now + self.cache_ttl, result)
+    
+    def _invalidate(self, method, endpoint):
+        """
+        作成・更新・削除したリソースに関係するGETのキャッシュを無効化
+        
+        同じ事業者の、同じ種類のリソース（ex_transactions等）を含むエンドポイントのキャッシュを削除する。
+        実行中の同じGETリクエストも待ち合わせの対象から外し、以降のGETは新たに通信する。
+        
+        Args:
+            method: HTTPメソッド
+            endpoint: 作成・更新・削除したエンドポイント
+        """
+        segments = endpoint.strip('/').split('/')
+        office_prefix = '/' + '/'.join(segments[:2])
+        # POSTは一覧、PUT/DELETEは個別リソース（末尾がID）のエンドポイント
+        collection = segments[-1] if method == "POST" else segments[-2]
+        def related(key):
+            return key[0].startswith(office_prefix) and collection in key[0].split('/')
+        
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._cache if related(key)]:
+                del self._cache[key]
+            for key in [key for key in self._inflight if related(key)]:
+                del self._inflight[key]
+    
+    def clear_cache(self):
+        """GETレスポンスのキャッシュをすべて削除"""
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+            self._inflight.clear()
+    
+    def _send(self, method, endpoint, params=None, data=None, json_data=None, retry_count=0):
+        """
+        APIリクエストを送信し、トレースが有効な場合は1回の呼び出しを1つのスパンとして記録
+        
+        Args:
+            method: HTTPメソッド
+            endpoint: エンドポイント
+            params: URLパラメータ
+            data: リクエストボディ（フォームデータ）
+            json_data: リクエストボディ（JSON）
+            retry_count: リトライ回数
+            
+        Returns:
+            レスポンスのJSONデータ
+        """
+        with profiling.span(f"{method} {endpoint}", 'api', method=method, endpoint=endpoint, retry=retry_count):
+            return self._send_once(method, endpoint, params, data, json_data, retry_count)
+    
+    def _send_once(self, method, endpoint, params=None, data=None, json_data=None, retry_count=0):
         """
         APIリクエストを送信（改善版）
         
@@ -38,26 +222,42 @@ class MFExpenseClient:
             raise Exception("認証されていません。先に認証を行ってください。")
             
         url = f"{self.base_url}{endpoint}"
+        body = data
+        headers = None
+        if json_data is not None:
+            body = json_codec.dumps(json_data)
+            headers = {'Content-Type': 'application/json'}
+        
+        # リフレッシュ要否の判定用に、送信に使うトークンを送信前に控えておく
+        # （失敗後に参照すると他のスレッドがリフレッシュ済みの新しいトークンになっている場合がある）
+        session = self.session
+        sent_token = session.token
         
         try:
-            response = self.session.request(
-                method=method,
-                url=url,
-                params=params,
-                data=data,
-                json=json_data
-            )
+            with profiling.span('http', 'net') as span_args:
+                response = session.request(
+                    method=method,
+                    url=url,
+                    params=params,
+                    data=body,
+                    headers=headers
+                )
+                span_args['status'] = response.status_code
+                span_args['server_ms'] = response.elapsed.total_seconds() * 1000
             response.raise_for_status()
-            return response.json()
+            if not response.content:
+                return None
+            with profiling.span('parse', 'json', bytes=len(response.content)):
+                return json_codec.loads(response.content)
             
         except TokenExpiredError as e:
             # TokenExpiredErrorを明示的にキャッチ
             print(f"トークンの有効期限が切れています。リフレッシュを試行します...")
             if retry_count < 1:  # 1回だけリトライ
-                if self.auth.refresh_token():
+                if self.auth.refresh_token(stale_token=sent_token):
                     print("トークンのリフレッシュが成功しました。")
                     self.session = self.auth.get_session()
-                    return self._request(method, endpoint, params, data, json_data, retry_count + 1)
+                    return self._send(method, endpoint, params, data, json_data, retry_count + 1)
                 else:
                     print("トークンのリフレッシュに失敗しました。再認証が必要です。")
                     raise Exception("トークンのリフレッシュに失敗しました。再認証を行ってください。")
@@ -70,10 +270,10 @@ class MFExpenseClient:
                 # 401エラーの場合もトークンリフレッシュを試行
                 print(f"401エラーが発生しました。トークンリフレッシュを試行します...")
                 if retry_count < 1:  # 1回だけリトライ
-                    if self.auth.refresh_token():
+                    if self.auth.refresh_token(stale_token=sent_token):
                         print("トークンのリフレッシュが成功しました。")
                         self.session = self.auth.get_session()
-                        return self._request(method, endpoint, params, data, json_data, retry_count + 1)
+                        return self._send(method, endpoint, params, data, json_data, retry_count + 1)
                     else:
                         print("トークンのリフレッシュに失敗しました。")
             
@@ -92,7 +292,7 @@ class MFExpenseClient:
         Returns:
             事業者一覧
         """
-        return self._request("GET", "/offices")
+        return self._parse(Office, self._request("GET", "/offices"))
     
     def get_ex_transactions(self, office_id=None, page=1, per_page=20, query=None):
         """
@@ -116,7 +316,7 @@ class MFExpenseClient:
         if query:
             params.update(query)
             
-        return self._request("GET", f"/offices/{office_id}/me/ex_transactions", params=params)
+        return self._parse(ExTransaction, self._request("GET", f"/offices/{office_id}/me/ex_transactions", params=params))
     
     def get_ex_transaction(self, transaction_id, office_id=None):
         """
@@ -130,7 +330,7 @@ class MFExpenseClient:
             経費明細の詳細
         """
         office_id = office_id or self.office_id
-        return self._request("GET", f"/offices/{office_id}/me/ex_transactions/{transaction_id}")
+        return self._parse(ExTransaction, self._request("GET", f"/offices/{office_id}/me/ex_transactions/{transaction_id}"))
     
     def create_ex_transaction(self, transaction_data, office_id=None):
         """
@@ -144,7 +344,7 @@ class MFExpenseClient:
             作成された経費明細
         """
         office_id = office_id or self.office_id
-        return self._request("POST", f"/offices/{office_id}/me/ex_transactions", json_data=transaction_data)
+        return self._parse(ExTransaction, self._request("POST", f"/offices/{office_id}/me/ex_transactions", json_data=transaction_data))
     
     def update_ex_transaction(self, transaction_id, transaction_data, office_id=None):
         """
@@ -159,7 +359,7 @@ class MFExpenseClient:
             更新された経費明細
         """
         office_id = office_id or self.office_id
-        return self._request("PUT", f"/offices/{office_id}/me/ex_transactions/{transaction_id}", json_data=transaction_data)
+        return self._parse(ExTransaction, self._request("PUT", f"/offices/{office_id}/me/ex_transactions/{transaction_id}", json_data=transaction_data))
     
     def delete_ex_transaction(self, transaction_id, office_id=None):
         """
@@ -197,7 +397,7 @@ class MFExpenseClient:
         if query:
             params.update(query)
             
-        return self._request("GET", f"/offices/{office_id}/me/ex_reports", params=params)
+        return self._parse(ExReport, self._request("GET", f"/offices/{office_id}/me/ex_reports", params=params))
     
     def get_ex_report(self, report_id, office_id=None):
         """
@@ -211,7 +411,7 @@ class MFExpenseClient:
             経費申請の詳細
         """
         office_id = office_id or self.office_id
-        return self._request("GET", f"/offices/{office_id}/me/ex_reports/{report_id}")
+        return self._parse(ExReport, self._request("GET", f"/offices/{office_id}/me/ex_reports/{report_id}"))
     
     def create_ex_report(self, report_data, office_id=None):
         """
@@ -225,7 +425,7 @@ class MFExpenseClient:
             作成された経費申請
         """
         office_id = office_id or self.office_id
-        return self._request("POST", f"/offices/{office_id}/me/ex_reports", json_data=report_data)
+        return self._parse(ExReport, self._request("POST", f"/offices/{office_id}/me/ex_reports", json_data=report_data))
     
     def update_ex_report(self, report_id, report_data, office_id=None):
         """
@@ -240,7 +440,7 @@ class MFExpenseClient:
             更新された経費申請
         """
         office_id = office_id or self.office_id
-        return self._request("PUT", f"/offices/{office_id}/me/ex_reports/{report_id}", json_data=report_data)
+        return self._parse(ExReport, self._request("PUT", f"/offices/{office_id}/me/ex_reports/{report_id}", json_data=report_data))
     
     def delete_ex_report(self, report_id, office_id=None):
         """
@@ -267,7 +467,7 @@ class MFExpenseClient:
             経費申請タイプ一覧
         """
         office_id = office_id or self.office_id
-        return self._request("GET", f"/offices/{office_id}/ex_report_types")
+        return self._parse(ExReportType, self._request("GET", f"/offices/{office_id}/ex_report_types"))
     
     def create_ex_transaction_for_member(self, office_member_id, transaction_data, office_id=None):
         """
@@ -282,4 +482,4 @@ class MFExpenseClient:
             作成された経費明細
         """
         office_id = office_id or self.office_id
-        return self._request("POST", f"/offices/{office_id}/office_members/{office_member_id}/ex_transactions", json_data=transaction_data)
\ No newline at end of file
+        return self._parse(ExTransaction, self._request("POST", f"/offices/{office_id}/office_members/{office_member_id}/ex_transactions", json_data=transaction_data))
\ No newline at end of file
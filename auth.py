@@ -1,39 +1,61 @@
 import json
 import os
+import threading
+from requests.adapters import HTTPAdapter
 from oauthlib.oauth2 import BackendApplicationClient
 from requests_oauthlib import OAuth2Session
-from config import MF_CLIENT_ID, MF_CLIENT_SECRET, MF_REDIRECT_URI, TOKEN_FILE
+import profiling
+from config import MF_CLIENT_ID, MF_CLIENT_SECRET, MF_REDIRECT_URI, TOKEN_FILE, MF_POOL_SIZE
 
 class MFAuth:
     """MoneyForward Expense API認証クラス"""
     
-    def __init__(self):
-        self.client_id = MF_CLIENT_ID
-        self.client_secret = MF_CLIENT_SECRET
-        self.redirect_uri = MF_REDIRECT_URI
+    def __init__(self, token_file=None, client_id=None, client_secret=None,
+                 redirect_uri=None, pool_size=None):
+        """
+        初期化
+        
+        Args:
+            token_file: トークン保存先（指定しない場合は設定ファイルの値を使用）
+            client_id: クライアントID（指定しない場合は設定ファイルの値を使用）
+            client_secret: クライアントシークレット（指定しない場合は設定ファイルの値を使用）
+            redirect_uri: リダイレクトURI（指定しない場合は設定ファイルの値を使用）
+            pool_size: コネクションプール数（指定しない場合は設定ファイルの値を使用）
+        """
+        self.client_id = client_id or MF_CLIENT_ID
+        self.client_secret = client_secret or MF_CLIENT_SECRET
+        self.redirect_uri = redirect_uri or MF_REDIRECT_URI
+        self.token_file = token_file or TOKEN_FILE
+        self.pool_size = pool_size or MF_POOL_SIZE
         self.token = None
         self.oauth = None
+        self._refresh_lock = threading.Lock()
         
         # 保存されたトークンがあれば読み込む
         self._load_token()
     
     def _load_token(self):
         """保存されたトークンを読み込む"""
-        if os.path.exists(TOKEN_FILE):
-            with open(TOKEN_FILE, 'r') as f:
+        if os.path.exists(self.token_file):
+            with open(self.token_file, 'r') as f:
                 self.token = json.load(f)
-                self.oauth = OAuth2Session(
-                    client_id=self.client_id,
-                    token=self.token
-                )
+                self.oauth = self._new_session(token=self.token)
             return True
         return False
     
     def _save_token(self):
         """トークンを保存する"""
-        with open(TOKEN_FILE, 'w') as f:
+        with open(self.token_file, 'w') as f:
             json.dump(self.token, f)
     
+    def _new_session(self, **kwargs):
+        """コネクションプールを設定したOAuth2セッションを作成する"""
+        oauth = OAuth2Session(client_id=self.client_id, **kwargs)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        oauth.mount('https://', adapter)
+        oauth.mount('http://', adapter)
+        return oauth
+    
     def get_authorization_url(self):
         """認証URLを取得する"""
         oauth = OAuth2Session(
@@ -53,10 +75,7 @@ class MFAuth:
         Args:
             authorization_response_or_code: 認証レスポンスのURLまたは認証コード
         """
-        oauth = OAuth2Session(
-            client_id=self.client_id,
-            redirect_uri=self.redirect_uri
-        )
+        oauth = self._new_session(redirect_uri=self.redirect_uri)
         
         # urn:ietf:wg:oauth:2.0:oob の場合は認証コードを直接使用
         if self.redirect_uri == 'urn:ietf:wg:oauth:2.0:oob' and not authorization_response_or_code.startswith('http'):
@@ -77,26 +96,31 @@ class MFAuth:
         self._save_token()
         return self.token
     
-    def refresh_token(self):
-        """トークンをリフレッシュする"""
+    def refresh_token(self, stale_token=None):
+        """トークンをリフレッシュする
+        
+        Args:
+            stale_token: 失効したトークン。他のスレッドが既にリフレッシュ済みの場合は再リフレッシュしない
+        """
         if not self.token:
             return False
-            
-        extra = {
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-        }
-        
-        self.oauth = OAuth2Session(
-            client_id=self.client_id,
-            token=self.token
-        )
         
-        self.token = self.oauth.refresh_token(
-            'https://expense.moneyforward.com/oauth/token',
-            **extra
-        )
-        self._save_token()
+        with self._refresh_lock, profiling.span('token_refresh', 'auth'):
+            if stale_token is not None and self.token.get('access_token') != stale_token.get('access_token'):
+                return True
+            
+            extra = {
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+            }
+            
+            self.oauth = self._new_session(token=self.token)
+            
+            self.token = self.oauth.refresh_token(
+                'https://expense.moneyforward.com/oauth/token',
+                **extra
+            )
+            self._save_token()
         return True
     
     def get_session(self):
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+import json_codec
+from models import ExTransaction
+
+def make_payload(count):
+    """一覧レスポンスと同じ形のダミーJSONを作成"""
+    transactions = []
+    for i in range(count):
+        transactions.append({
+            "id": f"tx{i:08d}",
+            "office_member_id": f"member{i % 500:04d}",
+            "recognized_at": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "value": 504 + i % 100,
+            "remark": "元赤坂オフィス (平和台(東京都)~赤坂見附 往復電車代)",
+            "memo": "平和台(東京都) -> 新宿三丁目 -> 赤坂見附",
+            "currency": "JPY",
+            "jpyrate": 1.0,
+            "use_custom_jpy_rate": False,
+            "ex_item_id": "svStdCnC5cVghDib7uJACA",
+            "dr_excise_id": "RgCz_0-_NktCGAF3o4xNTA",
+            "dept_id": "P8EYuTfTRlCzpmhJxLzciw",
+            "project_code_id": None,
+            "project_id": None,
+            "cr_item_id": "Ij4fDogDW4xfrBtMupArGQ",
+            "cr_sub_item_id": "dhNueknVU8xcK-uyQ3tc4w",
+            "created_at": "2024-12-01T09:00:00+09:00",
+            "updated_at": "2024-12-01T09:00:00+09:00",
+            "ex_item": {"id": "svStdCnC5cVghDib7uJACA", "name": "旅費交通費"},
+            "mf_file": None,
+        })
+    return json.dumps({"ex_transactions": transactions}, ensure_ascii=False).encode('utf-8')
+
+def measure(label, parse, raw):
+    """パース時間と保持メモリを計測（tracemallocの影響を避けるため別々に計測）"""
+    gc.collect()
+    start = time.perf_counter()
+    result = parse(raw)
+    elapsed = time.perf_counter() - start
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = parse(raw)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {elapsed * 1000:10.1f} ms {current / 1024 / 1024:10.1f} MiB")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='辞書と型付きモデルのメモリ使用量・パース時間を比較')
+    parser.add_argument('--count', type=int, default=100000, help='経費明細の件数')
+    args = parser.parse_args()
+
+    raw = make_payload(args.count)
+    print(f"{args.count}件 ({len(raw) / 1024 / 1024:.1f} MiB)")
+    print(f"{'':<24} {'parse':>13} {'retained':>14}")
+
+    codecs = ['json'] + (['orjson'] if json_codec.orjson is not None else [])
+    for name in codecs:
+        codec = json_codec.set_codec(name)
+        measure(f"dict ({name})", lambda data: codec.loads(data)["ex_transactions"], raw)
+        measure(f"ExTransaction ({name})", lambda data: ExTransaction.parse(codec.loads(data)), raw)
+
+if __name__ == "__main__":
+    main()
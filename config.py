@@ -16,4 +16,16 @@ MF_API_BASE_URL = 'https://expense.moneyforward.com/api/external/v1'
 MF_OFFICE_ID = os.getenv('MF_OFFICE_ID')
 
 # トークン保存先
-TOKEN_FILE = 'token.json'
\ No newline at end of file
+TOKEN_FILE = 'token.json'
+
+# 複数事業者設定ファイル
+MF_OFFICES_FILE = os.getenv('MF_OFFICES_FILE', 'offices.json')
+
+# 1事業者あたりのコネクションプール数
+MF_POOL_SIZE = int(os.getenv('MF_POOL_SIZE', '10'))
+
+# JSONコーデック（auto: orjsonがインストールされていれば使用、json、orjson）
+MF_JSON_CODEC = os.getenv('MF_JSON_CODEC', 'auto')
+
+# GETレスポンスのキャッシュ秒数（0で無効）
+MF_CACHE_TTL = float(os.getenv('MF_CACHE_TTL', '0'))
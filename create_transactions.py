@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import copy
 import json
 import os
 import subprocess
 import argparse
 import re
 from datetime import datetime
+import profiling
 
 def is_valid_date(date_str):
     """日付形式（YYYY-MM-DD）が正しいかチェック"""
@@ -20,8 +22,14 @@ def is_valid_date(date_str):
     except ValueError:
         return False
 
-def create_transaction(date, template):
-    """指定した日付の経費明細を作成"""
+def create_transaction(date, template, profile=False):
+    """指定した日付の経費明細を作成
+    
+    Args:
+        date: 日付（YYYY-MM-DD）
+        template: 経費明細テンプレート
+        profile: Trueの場合、main.pyにも--profileを指定する
+    """
     # 日付を設定
     template["ex_transaction"]["recognized_at"] = date
     
@@ -32,38 +40,185 @@ def create_transaction(date, template):
     
     print(f"Created transaction file for {date}: {filename}")
     
+    # 計測・トレースが有効な場合はmain.pyにも指定し、トレースは後で結合する
+    command = ["python3", "main.py"]
+    if profile:
+        command.append("--profile")
+    trace_file = None
+    if profiling.get_tracer() is not None:
+        trace_file = f"transaction_{date}.trace.json"
+        command += ["--trace", trace_file]
+    command += ["create", filename]
+    
     # APIを使って経費明細を作成
     try:
-        result = subprocess.run(
-            ["python3", "main.py", "create", filename],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        with profiling.span(f"main.py create {date}", 'subprocess', date=date):
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                check=True
+            )
         print(f"Successfully created transaction for {date}")
         print(result.stdout)
+        if profile:
+            print(result.stderr)
         return True
     except subprocess.CalledProcessError as e:
         print(f"Error creating transaction for {date}")
         print(e.stderr)
         return False
+    finally:
+        if trace_file and os.path.exists(trace_file):
+            profiling.get_tracer().extend(profiling.load_trace_events(trace_file))
+            os.remove(trace_file)
 
-def main():
-    # コマンドライン引数の解析
-    parser = argparse.ArgumentParser(description='赤坂オフィスへの交通費明細を作成')
-    parser.add_argument('dates', nargs='+', help='明細を作成する日付（YYYY-MM-DD形式）')
-    parser.add_argument('--template', default='transaction_template.json', help='テンプレートJSONファイル')
-    args = parser.parse_args()
-    
-    # テンプレートJSONファイルを読み込む
+def load_template(path):
+    """テンプレートJSONファイルを読み込む（読み込めない場合はNone）"""
     try:
-        with open(args.template, 'r', encoding='utf-8') as f:
-            template = json.load(f)
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
     except FileNotFoundError:
-        print(f"エラー: テンプレートファイル '{args.template}' が見つかりません")
-        return
+        print(f"エラー: テンプレートファイル '{path}' が見つかりません")
     except json.JSONDecodeError:
-        print(f"エラー: テンプレートファイル '{args.template}' の形式が正しくありません")
+        print(f"エラー: テンプレートファイル '{path}' の形式が正しくありません")
+    return None
+
+def submit_transaction(client, transaction_data):
+    """APIクライアントで経費明細を作成"""
+    return client.create_ex_transaction(transaction_data)
+
+def create_transactions_multi_office(dates, template_path, offices_file=None, office_names=None):
+    """複数事業者に対して経費明細を並行作成
+    
+    Args:
+        dates: 明細を作成する日付のリスト
+        template_path: 事業者設定にテンプレート指定がない場合のテンプレートJSONファイル
+        offices_file: 複数事業者設定ファイル
+        office_names: 対象の事業者名のリスト（指定しない場合は全事業者）
+        
+    Returns:
+        (成功件数, エラー件数)
+    """
+    from multi_office import load_offices, MultiOfficeRunner
+    
+    offices = load_offices(offices_file)
+    names = office_names or list(offices)
+    
+    jobs = {}
+    error_count = 0
+    for name in names:
+        if name not in offices:
+            print(f"エラー: 事業者 '{name}' が設定ファイルに見つかりません")
+            error_count += 1
+            continue
+        template = load_template(offices[name].template or template_path)
+        if template is None:
+            error_count += 1
+            continue
+        jobs[name] = []
+        for date in dates:
+            transaction_data = copy.deepcopy(template)
+            transaction_data["ex_transaction"]["recognized_at"] = date
+            jobs[name].append((submit_transaction, (transaction_data,)))
+    
+    results = MultiOfficeRunner(offices).run(jobs)
+    
+    success_count = 0
+    for name, office_results in results.items():
+        for date, (ok, result) in zip(dates, office_results):
+            if ok:
+                print(f"[{name}] Successfully created transaction for {date}")
+                success_count += 1
+            else:
+                print(f"[{name}] Error creating transaction for {date}: {result}")
+                error_count += 1
+    return success_count, error_count
+
+def enqueue_transactions(dates, template_path, queue_url, offices_file=None, office_names=None, wal=True):
+    """経費明細の作成を作業キューに登録（main.py workerで実行）
+    
+    Args:
+        dates: 明細を作成する日付のリスト
+        template_path: 事業者設定にテンプレート指定がない場合のテンプレートJSONファイル
+        queue_url: 作業キュー（SQLiteファイルのパスまたはURL）
+        offices_file: 複数事業者設定ファイル
+        office_names: 対象の事業者名のリスト（offices_fileのみ指定した場合は全事業者）
+        wal: SQLiteのWALモードを使用するか
+        
+    Returns:
+        (登録件数, エラー件数)
+    """
+    import work_queue
+    
+    targets = [(None, template_path)]
+    error_count = 0
+    if offices_file or office_names:
+        from multi_office import load_offices
+        offices = load_offices(offices_file)
+        targets = []
+        for name in office_names or list(offices):
+            if name not in offices:
+                print(f"エラー: 事業者 '{name}' が設定ファイルに見つかりません")
+                error_count += 1
+                continue
+            targets.append((name, offices[name].template or template_path))
+    
+    queue = work_queue.open_queue(queue_url, wal=wal)
+    count = 0
+    try:
+        for office, path in targets:
+            template = load_template(path)
+            if template is None:
+                error_count += 1
+                continue
+            for date in dates:
+                transaction_data = copy.deepcopy(template)
+                transaction_data["ex_transaction"]["recognized_at"] = date
+                # 同じ内容の作業は登録済みであれば重複して登録されない
+                if queue.enqueue('create_ex_transaction', {'transaction_data': transaction_data}, office):
+                    count += 1
+    finally:
+        queue.close()
+    return count, error_count
+
+def validate_dates(dates):
+    """日付形式をチェックし、(正しい日付のリスト, エラー件数)を返す"""
+    valid = []
+    error_count = 0
+    for date in dates:
+        if not is_valid_date(date):
+            print(f"エラー: '{date}' は正しい日付形式（YYYY-MM-DD）ではありません")
+            error_count += 1
+            continue
+        valid.append(date)
+    return valid, error_count
+
+def run(args):
+    """経費明細を作成"""
+    # 作業キューに登録するモード
+    if args.enqueue:
+        dates, error_count = validate_dates(args.dates)
+        count, enqueue_error_count = enqueue_transactions(
+            dates, args.template, args.enqueue, args.offices_file, args.office, wal=not args.no_wal
+        )
+        print(f"\n{count}件の作業をキューに登録しました: {args.enqueue}（{error_count + enqueue_error_count}件エラー）")
+        print(f"実行するには: python3 main.py worker --queue {args.enqueue}{' --no-wal' if args.no_wal else ''}")
+        return
+    
+    # 複数事業者モード
+    if args.offices_file or args.office:
+        dates, error_count = validate_dates(args.dates)
+        
+        success_count, office_error_count = create_transactions_multi_office(
+            dates, args.template, args.offices_file, args.office
+        )
+        print(f"\n処理完了: {success_count}件成功, {error_count + office_error_count}件エラー")
+        return
+    
+    # テンプレートJSONファイルを読み込む
+    template = load_template(args.template)
+    if template is None:
         return
     
     # 各日付について経費明細を作成
@@ -76,12 +231,29 @@ def main():
             error_count += 1
             continue
         
-        if create_transaction(date, template):
+        if create_transaction(date, template, profile=args.profile):
             success_count += 1
         else:
             error_count += 1
     
     print(f"\n処理完了: {success_count}件成功, {error_count}件エラー")
 
+def main():
+    # コマンドライン引数の解析
+    parser = argparse.ArgumentParser(description='赤坂オフィスへの交通費明細を作成')
+    parser.add_argument('dates', nargs='+', help='明細を作成する日付（YYYY-MM-DD形式）')
+    parser.add_argument('--template', default='transaction_template.json', help='テンプレートJSONファイル')
+    parser.add_argument('--offices-file', help='複数事業者設定ファイル（指定時は複数事業者モードで実行）')
+    parser.add_argument('--office', action='append', help='対象の事業者名（複数指定可、省略時は全事業者）')
+    parser.add_argument('--enqueue', metavar='QUEUE', help='作成する代わりに作業キュー（SQLiteファイル）に登録する')
+    parser.add_argument('--no-wal', action='store_true', help='SQLiteのWALモードを使用しない（ネットワークファイルシステム上で共有する場合）')
+    parser.add_argument('--profile', action='store_true', help='cProfileで計測し、要約を表示')
+    parser.add_argument('--trace', metavar='FILE', help='API呼び出しのトレース（Chrome/Perfetto形式のJSON）を保存')
+    args = parser.parse_args()
+    
+    # --profile / --trace が指定されていれば計測しながら実行
+    with profiling.profile_and_trace(args.profile, args.trace):
+        run(args)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
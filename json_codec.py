@@ -0,0 +1,98 @@
+import json
+from config import MF_JSON_CODEC
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj):
+    """標準のJSONで扱えないオブジェクト（モデル等）を変換する"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _prepare(obj):
+    """リストのサブクラス（ModelList等）はエンコーダがそのままリストとして扱うため、先にto_dictで変換する"""
+    if isinstance(obj, list) and hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    return obj
+
+class JSONCodec:
+    """標準ライブラリjsonによるエンコーダ/デコーダ"""
+
+    name = 'json'
+
+    def loads(self, data):
+        """JSON文字列またはバイト列をデコードする"""
+        return json.loads(data)
+
+    def dumps(self, obj):
+        """オブジェクトをコンパクトなJSONバイト列にエンコードする"""
+        return json.dumps(_prepare(obj), ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+    def dumps_pretty(self, obj):
+        """オブジェクトを表示用（インデント付き）のJSON文字列にエンコードする"""
+        return json.dumps(_prepare(obj), indent=2, ensure_ascii=False, default=_default)
+
+class OrjsonCodec(JSONCodec):
+    """orjsonによる高速なエンコーダ/デコーダ"""
+
+    name = 'orjson'
+
+    def loads(self, data):
+        """JSON文字列またはバイト列をデコードする"""
+        return orjson.loads(data)
+
+    def dumps(self, obj):
+        """オブジェクトをコンパクトなJSONバイト列にエンコードする"""
+        return orjson.dumps(_prepare(obj), default=_default)
+
+    def dumps_pretty(self, obj):
+        """オブジェクトを表示用（インデント付き）のJSON文字列にエンコードする"""
+        return orjson.dumps(_prepare(obj), default=_default, option=orjson.OPT_INDENT_2).decode('utf-8')
+
+CODECS = {
+    'json': JSONCodec,
+    'orjson': OrjsonCodec,
+}
+
+_codec = None
+
+def set_codec(name):
+    """
+    使用するコーデックを切り替える
+
+    Args:
+        name: コーデック名（'json'、'orjson'、'auto'）。'auto'はorjsonがあれば優先する
+
+    Returns:
+        選択されたコーデック
+    """
+    global _codec
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name not in CODECS:
+        raise ValueError(f"不明なJSONコーデックです: {name}")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("orjsonがインストールされていません")
+    _codec = CODECS[name]()
+    return _codec
+
+def get_codec():
+    """現在のコーデックを取得する"""
+    return _codec
+
+def loads(data):
+    """現在のコーデックでデコードする"""
+    return _codec.loads(data)
+
+def dumps(obj):
+    """現在のコーデックでコンパクトなJSONバイト列にエンコードする"""
+    return _codec.dumps(obj)
+
+def dumps_pretty(obj):
+    """現在のコーデックで表示用のJSON文字列にエンコードする"""
+    return _codec.dumps_pretty(obj)
+
+set_codec(MF_JSON_CODEC)
@@ -1,17 +1,30 @@
 #!/usr/bin/env python3
 import argparse
 import json
+import os
 import sys
+import threading
 import webbrowser
 from urllib.parse import urlparse, parse_qs
 
+import analytics
+import json_codec
+import profiling
+import reconcile
+import work_queue
+import worker
 from auth import MFAuth
 from api_client import MFExpenseClient
 from config import MF_OFFICE_ID
+from multi_office import load_offices
 
-def authenticate():
-    """認証処理を行う"""
-    auth = MFAuth()
+def authenticate(auth=None):
+    """認証処理を行う
+    
+    Args:
+        auth: MFAuthインスタンス。指定しない場合は新規作成
+    """
+    auth = auth or MFAuth()
     
     # すでに認証済みの場合はセッションを返す
     if auth.get_session():
@@ -45,7 +58,7 @@ def authenticate():
 def list_offices(client):
     """事業者一覧を表示"""
     offices = client.get_offices()
-    print(json.dumps(offices, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(offices))
     return offices
 
 def list_transactions(client, args):
@@ -61,13 +74,13 @@ def list_transactions(client, args):
         per_page=args.per_page,
         query=query
     )
-    print(json.dumps(transactions, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(transactions))
     return transactions
 
 def get_transaction(client, args):
     """経費明細の詳細を表示"""
     transaction = client.get_ex_transaction(args.id)
-    print(json.dumps(transaction, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(transaction))
     return transaction
 
 def create_transaction(client, args):
@@ -77,7 +90,7 @@ def create_transaction(client, args):
         transaction_data = json.load(f)
     
     result = client.create_ex_transaction(transaction_data)
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(result))
     return result
 
 def create_transaction_for_member(client, args):
@@ -87,7 +100,7 @@ def create_transaction_for_member(client, args):
         transaction_data = json.load(f)
     
     result = client.create_ex_transaction_for_member(args.member_id, transaction_data)
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(result))
     return result
 
 def update_transaction(client, args):
@@ -97,13 +110,13 @@ def update_transaction(client, args):
         transaction_data = json.load(f)
     
     result = client.update_ex_transaction(args.id, transaction_data)
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(result))
     return result
 
 def delete_transaction(client, args):
     """経費明細を削除"""
     result = client.delete_ex_transaction(args.id)
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(result))
     return result
 
 def list_reports(client, args):
@@ -112,19 +125,19 @@ def list_reports(client, args):
         page=args.page,
         per_page=args.per_page
     )
-    print(json.dumps(reports, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(reports))
     return reports
 
 def list_report_types(client):
     """経費申請タイプ一覧を表示"""
     report_types = client.get_ex_report_types()
-    print(json.dumps(report_types, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(report_types))
     return report_types
 
 def get_report(client, args):
     """経費申請の詳細を表示"""
     report = client.get_ex_report(args.id)
-    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(report))
     return report
 
 def create_report(client, args):
@@ -134,7 +147,7 @@ def create_report(client, args):
         report_data = json.load(f)
     
     result = client.create_ex_report(report_data)
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(result))
     return result
 
 def update_report(client, args):
@@ -144,15 +157,170 @@ def update_report(client, args):
         report_data = json.load(f)
     
     result = client.update_ex_report(args.id, report_data)
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(result))
     return result
 
 def delete_report(client, args):
     """経費申請を削除"""
     result = client.delete_ex_report(args.id)
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(json_codec.dumps_pretty(result))
     return result
 
+def reconcile_transactions(client, args, office=None):
+    """理想状態のJSONLと現在の経費明細の差分を求め、必要な作成・更新・削除のみを実行
+    
+    Args:
+        client: MFExpenseClientインスタンス
+        args: コマンドライン引数
+        office: --officeで指定した事業者（指定時は事業者のレート制限を守って実行）
+    """
+    desired = reconcile.load_jsonl(args.desired_file)
+    
+    # 現在の状態はローカルミラーがあればそこから、なければAPIから取得
+    if args.mirror and os.path.exists(args.mirror) and not args.refresh_mirror:
+        current = reconcile.load_jsonl(args.mirror)
+    else:
+        current = reconcile.fetch_current(client)
+        if args.mirror:
+            reconcile.save_jsonl(args.mirror, current)
+    
+    key_fields = [field.strip() for field in args.key.split(',') if field.strip()]
+    plan = reconcile.build_plan(
+        desired, current,
+        key_fields=key_fields,
+        since=args.since,
+        until=args.until,
+        delete=not args.no_delete
+    )
+    reconcile.print_plan(plan)
+    
+    if args.enqueue:
+        queue = work_queue.open_queue(args.enqueue, wal=not args.no_wal)
+        try:
+            count = reconcile.enqueue_plan(queue, plan, office=args.office)
+        finally:
+            queue.close()
+        print(f"\n{count}件の作業をキューに登録しました: {args.enqueue}")
+        return plan
+    
+    if not args.apply:
+        print("\n--apply を指定すると上記の変更を実行します")
+        return plan
+    
+    succeeded, failed = reconcile.apply_plan(client, plan, workers=args.workers, office=office)
+    for e in failed:
+        print(f"エラー: {e}")
+    print(f"\n処理完了: {len(succeeded)}件成功, {len(failed)}件エラー")
+    
+    if args.mirror:
+        reconcile.save_jsonl(args.mirror, reconcile.apply_to_mirror(current, succeeded))
+    return plan
+
+def summarize_transactions(client, args):
+    """経費明細をグループごとに集計して表示"""
+    group_by = [key.strip() for key in args.group_by.split(',') if key.strip()]
+    for key in group_by:
+        if key != 'month' and key not in analytics.GROUP_FIELDS:
+            print(f"エラー: '{key}' は集計できない項目です（member, dept, item, project, month）")
+            sys.exit(1)
+    
+    # 経費明細はファイルがあればそこから、なければAPIから取得
+    # APIから取得できるのは認証したユーザー自身の経費明細のみ（事業者全体はエクスポートしたJSONLを--inputで指定）
+    if args.input:
+        records = reconcile.load_jsonl(args.input)
+    else:
+        if 'member' in group_by:
+            print("注意: APIから取得するのは自分の経費明細のみです。事業者全体をメンバー別に集計するには--inputを指定してください",
+                  file=sys.stderr)
+        records = reconcile.fetch_current(client, since=args.since, until=args.until)
+    table = analytics.TransactionTable.from_records(records).between(args.since, args.until)
+    
+    # テンプレートと同じ経費科目で金額が異なる明細を外れ値とする
+    outliers = None
+    if args.template and os.path.exists(args.template):
+        with open(args.template, 'r', encoding='utf-8') as f:
+            template = json.load(f).get('ex_transaction', {})
+        if template.get('ex_item_id') and template.get('value') is not None:
+            outliers = table.outlier_mask(template['ex_item_id'], template['value'])
+    
+    rows = table.summarize(group_by, outliers)
+    if args.format == 'json':
+        print(json_codec.dumps_pretty(rows))
+    else:
+        print(analytics.format_rows(rows, group_by))
+    return rows
+
+def run_queue_worker(args):
+    """作業キューから作業を取得して実行"""
+    queue = work_queue.open_queue(
+        args.queue,
+        visibility_timeout=args.visibility_timeout,
+        max_attempts=args.max_attempts,
+        wal=not args.no_wal
+    )
+    
+    # 事業者名が指定された作業がある場合のみ複数事業者設定ファイルを読み込み、
+    # 事業者名が指定されていない作業がある場合のみ既定の事業者（--office指定時はその事業者）の認証を行う
+    # （ワーカースレッドから同時に呼ばれるため、ロックを取って1回だけ実行する）
+    offices = {}
+    clients = []
+    lock = threading.RLock()
+    def get_offices():
+        with lock:
+            if not offices:
+                offices.update(load_offices(args.offices_file))
+                # レート制限は同じキューを使うすべてのワーカーで共有する
+                for office in offices.values():
+                    office.share_rate_limit(queue)
+            return offices
+    
+    def get_client():
+        with lock:
+            if not clients:
+                if args.office:
+                    office = get_offices()[args.office]
+                    authenticate(office.auth)
+                    office.client.session = office.auth.get_session()
+                    clients.append(office.client)
+                else:
+                    clients.append(MFExpenseClient(authenticate()))
+            return clients[0]
+    
+    if args.office and args.office not in get_offices():
+        print(f"エラー: 事業者 '{args.office}' が設定ファイルに見つかりません")
+        queue.close()
+        sys.exit(1)
+    
+    worker_id = args.worker_id or work_queue.default_worker_id()
+    print(f"[{worker_id}] ワーカーを開始します: {args.queue}")
+    try:
+        done_count, failed_count = worker.run_worker(
+            queue, get_client, worker_id,
+            concurrency=args.concurrency,
+            poll_interval=args.poll_interval,
+            exit_when_empty=args.exit_when_empty,
+            max_items=args.max_items,
+            offices=get_offices
+        )
+    except KeyboardInterrupt:
+        print(f"\n[{worker_id}] 中断しました（実行中の作業はリースの期限切れ後に再実行されます）")
+        return
+    finally:
+        queue.close()
+    print(f"\n[{worker_id}] 処理完了: {done_count}件成功, {failed_count}件エラー")
+
+def show_queue_status(args):
+    """作業キューの進捗を表示"""
+    queue = work_queue.open_queue(args.queue, wal=not args.no_wal)
+    try:
+        worker.watch_progress(queue, interval=args.watch)
+        for item_id, kind, office, error in queue.failures():
+            print(f"失敗: 作業{item_id} {kind} {office or ''} {error}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+
 def create_example_json():
     """経費明細作成用のサンプルJSONファイルを作成"""
     example_data = {
@@ -185,9 +353,76 @@ def create_report_example_json():
     
     print("経費申請用サンプルJSONファイルを作成しました: example_report.json")
 
+def run_command(args):
+    """認証を行い、コマンドに応じた処理を実行"""
+    # ファイルからの集計・キューの進捗表示は認証不要
+    if args.command == 'summarize' and args.input:
+        summarize_transactions(None, args)
+        return
+    elif args.command == 'queue-status':
+        show_queue_status(args)
+        return
+    elif args.command == 'worker':
+        # 認証は作業の事業者ごとに必要になった時点で行う
+        run_queue_worker(args)
+        return
+    
+    # 認証処理
+    if args.office:
+        offices = load_offices(args.offices_file)
+        if args.office not in offices:
+            print(f"エラー: 事業者 '{args.office}' が設定ファイルに見つかりません")
+            sys.exit(1)
+        office = offices[args.office]
+        authenticate(office.auth)
+        client = office.client
+        client.session = office.auth.get_session()
+    else:
+        office = None
+        auth = authenticate()
+        client = MFExpenseClient(auth)
+    
+    # コマンドに応じた処理を実行
+    if args.command == 'auth':
+        print("認証が完了しています")
+    elif args.command == 'offices':
+        list_offices(client)
+    elif args.command == 'list':
+        list_transactions(client, args)
+    elif args.command == 'get':
+        get_transaction(client, args)
+    elif args.command == 'create':
+        create_transaction(client, args)
+    elif args.command == 'create-for-member':
+        create_transaction_for_member(client, args)
+    elif args.command == 'update':
+        update_transaction(client, args)
+    elif args.command == 'delete':
+        delete_transaction(client, args)
+    elif args.command == 'report-list':
+        list_reports(client, args)
+    elif args.command == 'report-get':
+        get_report(client, args)
+    elif args.command == 'report-create':
+        create_report(client, args)
+    elif args.command == 'report-update':
+        update_report(client, args)
+    elif args.command == 'report-delete':
+        delete_report(client, args)
+    elif args.command == 'report-types':
+        list_report_types(client)
+    elif args.command == 'reconcile':
+        reconcile_transactions(client, args, office)
+    elif args.command == 'summarize':
+        summarize_transactions(client, args)
+
 def main():
     """メイン処理"""
     parser = argparse.ArgumentParser(description='MoneyForward Expense API CLI')
+    parser.add_argument('--office', help='複数事業者設定ファイルに定義された事業者名（指定時はその事業者のトークンで実行）')
+    parser.add_argument('--offices-file', help='複数事業者設定ファイル（デフォルト: MF_OFFICES_FILE）')
+    parser.add_argument('--profile', action='store_true', help='cProfileで計測し、要約を標準エラー出力に表示')
+    parser.add_argument('--trace', metavar='FILE', help='API呼び出しのトレース（Chrome/Perfetto形式のJSON）を保存')
     subparsers = parser.add_subparsers(dest='command', help='コマンド')
     
     # 認証コマンド
@@ -256,6 +491,47 @@ def main():
     # 経費申請用サンプルJSONファイル作成コマンド
     report_example_parser = subparsers.add_parser('report-example', help='経費申請用サンプルJSONファイルを作成')
     
+    # 差分適用コマンド
+    reconcile_parser = subparsers.add_parser('reconcile', help='理想状態のJSONLとの差分だけ経費明細を作成・更新・削除')
+    reconcile_parser.add_argument('desired_file', help='理想状態の経費明細を1行1件で記述したJSONLファイル')
+    reconcile_parser.add_argument('--apply', action='store_true', help='差分を表示するだけでなく実行する')
+    reconcile_parser.add_argument('--key', default=','.join(reconcile.DEFAULT_KEY_FIELDS), help='明細を照合するキーのフィールド（カンマ区切り）')
+    reconcile_parser.add_argument('--since', help='削除対象とする期間の開始日（省略時は理想状態の最初の日付）')
+    reconcile_parser.add_argument('--until', help='削除対象とする期間の終了日（省略時は理想状態の最後の日付）')
+    reconcile_parser.add_argument('--no-delete', action='store_true', help='理想状態にない明細を削除しない（削除は理想状態に含まれる経費科目の明細に限る）')
+    reconcile_parser.add_argument('--mirror', help='現在の状態のローカルミラー（JSONL）。存在すればAPIの代わりに使用し、実行後に更新する')
+    reconcile_parser.add_argument('--refresh-mirror', action='store_true', help='ローカルミラーをAPIから取得し直す')
+    reconcile_parser.add_argument('--workers', type=int, default=4, help='同時実行数')
+    reconcile_parser.add_argument('--enqueue', metavar='QUEUE', help='差分を実行する代わりに作業キューに登録する')
+    reconcile_parser.add_argument('--no-wal', action='store_true', help='SQLiteのWALモードを使用しない（ネットワークファイルシステム上で共有する場合）')
+    
+    # 集計コマンド
+    summarize_parser = subparsers.add_parser('summarize', help='経費明細をグループごとに集計')
+    summarize_parser.add_argument('--group-by', default='member,month', help='集計する項目（member, dept, item, project, monthをカンマ区切り）')
+    summarize_parser.add_argument('--since', help='集計期間の開始日（YYYY-MM-DD）')
+    summarize_parser.add_argument('--until', help='集計期間の終了日（YYYY-MM-DD）')
+    summarize_parser.add_argument('--input', help='経費明細のJSONLファイル（事業者全体のエクスポート、reconcileのミラー等）。指定しない場合はAPIから自分の経費明細を取得')
+    summarize_parser.add_argument('--template', default='transaction_template.json', help='外れ値の判定に使うテンプレートJSONファイル')
+    summarize_parser.add_argument('--format', choices=['text', 'json'], default='text', help='出力形式')
+    
+    # ワーカーコマンド
+    worker_parser = subparsers.add_parser('worker', help='作業キューから作業を取得して実行（複数プロセス・ホストで同時実行可）')
+    worker_parser.add_argument('--queue', required=True, help='作業キュー（SQLiteファイルのパスまたはURL）')
+    worker_parser.add_argument('--concurrency', type=int, default=4, help='同時実行数')
+    worker_parser.add_argument('--visibility-timeout', type=float, default=work_queue.DEFAULT_VISIBILITY_TIMEOUT, help='リースの有効期間（秒）')
+    worker_parser.add_argument('--max-attempts', type=int, default=work_queue.DEFAULT_MAX_ATTEMPTS, help='最大試行回数')
+    worker_parser.add_argument('--poll-interval', type=float, default=1.0, help='キューが空の場合の待機秒数')
+    worker_parser.add_argument('--exit-when-empty', action='store_true', help='未処理・処理中の作業がなくなったら終了')
+    worker_parser.add_argument('--max-items', type=int, help='処理する最大件数')
+    worker_parser.add_argument('--worker-id', help='ワーカーID（デフォルト: ホスト名:プロセスID）')
+    worker_parser.add_argument('--no-wal', action='store_true', help='SQLiteのWALモードを使用しない（ネットワークファイルシステム上で共有する場合）')
+    
+    # 作業キューの進捗表示コマンド
+    queue_status_parser = subparsers.add_parser('queue-status', help='作業キューの進捗を表示')
+    queue_status_parser.add_argument('--queue', required=True, help='作業キュー（SQLiteファイルのパスまたはURL）')
+    queue_status_parser.add_argument('--watch', type=float, default=0, metavar='SEC', help='指定秒数ごとに更新して表示（完了まで）')
+    queue_status_parser.add_argument('--no-wal', action='store_true', help='SQLiteのWALモードを使用しない（ネットワークファイルシステム上で共有する場合）')
+    
     args = parser.parse_args()
     
     # コマンドが指定されていない場合はヘルプを表示
@@ -271,39 +547,9 @@ def main():
         create_report_example_json()
         return
     
-    # 認証処理
-    auth = authenticate()
-    client = MFExpenseClient(auth)
-    
-    # コマンドに応じた処理を実行
-    if args.command == 'auth':
-        print("認証が完了しています")
-    elif args.command == 'offices':
-        list_offices(client)
-    elif args.command == 'list':
-        list_transactions(client, args)
-    elif args.command == 'get':
-        get_transaction(client, args)
-    elif args.command == 'create':
-        create_transaction(client, args)
-    elif args.command == 'create-for-member':
-        create_transaction_for_member(client, args)
-    elif args.command == 'update':
-        update_transaction(client, args)
-    elif args.command == 'delete':
-        delete_transaction(client, args)
-    elif args.command == 'report-list':
-        list_reports(client, args)
-    elif args.command == 'report-get':
-        get_report(client, args)
-    elif args.command == 'report-create':
-        create_report(client, args)
-    elif args.command == 'report-update':
-        update_report(client, args)
-    elif args.command == 'report-delete':
-        delete_report(client, args)
-    elif args.command == 'report-types':
-        list_report_types(client)
+    # --profile / --trace が指定されていれば計測しながら実行
+    with profiling.profile_and_trace(args.profile, args.trace):
+        run_command(args)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,209 @@
+import json_codec
+
+def _pack(fields):
+    """フィールドの辞書を保持用のJSONバイト列にエンコード
+
+    orjsonの出力バッファは余分に確保されているため、必要なサイズにコピーして保持する。
+    """
+    if not fields:
+        return None
+    return memoryview(json_codec.dumps(fields)).tobytes()
+
+_MISSING = object()
+
+class ModelList(list):
+    """モデルのリスト（ページネーション等のメタ情報を保持）"""
+
+    __slots__ = ('meta', 'key')
+
+    def __init__(self, items=(), meta=None, key=None):
+        """
+        初期化
+
+        Args:
+            items: モデルのリスト
+            meta: 一覧レスポンスのリスト以外の値（ページネーション等）
+            key: 一覧レスポンスのリストのキー（ex_transactions等）
+        """
+        super().__init__(items)
+        self.meta = meta or {}
+        self.key = key
+
+    def to_dict(self):
+        """一覧レスポンスと同じ形の辞書に変換（keyがない場合はリスト）"""
+        items = [item.to_dict() for item in self]
+        if self.key is None:
+            return items
+        return {self.key: items, **self.meta}
+
+class Model:
+    """APIレスポンスの型付きモデル基底クラス
+
+    既知のフィールドは__slots__に保持し、それ以外のフィールド（ネストしたオブジェクト等）は
+    JSONバイト列に再エンコードして保持し、参照時にデコードする。
+    デコード済みのレスポンスから変換するため、メモリ使用量は辞書より少ないがパースは辞書より遅い。
+    レスポンスに含まれなかった既知のフィールドはスロットを未設定のままにし、
+    属性としてはNoneを返すが、get()・[]・to_dict()では辞書と同様に存在しないキーとして扱う。
+    """
+
+    __slots__ = ('_extra',)
+    FIELDS = ()
+    _field_set = frozenset()
+    WRAPPER_KEY = None
+    LIST_KEY = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            if name in fields:
+                setattr(self, name, fields.pop(name))
+        self._extra = _pack(fields)
+
+    def __getattr__(self, name):
+        # 未設定のスロット（レスポンスに含まれなかったフィールド）を参照した場合のみ呼ばれる
+        if name in type(self)._field_set:
+            return None
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        辞書からモデルを作成
+
+        Args:
+            data: APIレスポンスの辞書（{"ex_transaction": {...}}のようなラッパー付きも可）
+
+        Returns:
+            モデル
+        """
+        if cls.WRAPPER_KEY in data and len(data) == 1:
+            data = data[cls.WRAPPER_KEY]
+        obj = cls.__new__(cls)
+        for name in cls.FIELDS:
+            if name in data:
+                setattr(obj, name, data[name])
+        field_set = cls._field_set
+        extra = {key: value for key, value in data.items() if key not in field_set}
+        obj._extra = _pack(extra)
+        return obj
+
+    @classmethod
+    def parse(cls, payload):
+        """
+        APIレスポンスをモデルに変換
+
+        Args:
+            payload: APIレスポンス（単体・リスト・一覧レスポンスの辞書）
+
+        Returns:
+            単体の場合はモデル、一覧の場合はModelList
+        """
+        if payload is None or isinstance(payload, Model):
+            return payload
+        if isinstance(payload, list):
+            # 型付きクライアントの結果（ModelList）はそのまま使う
+            return ModelList((cls._from_item(item) for item in payload), getattr(payload, 'meta', None),
+                             getattr(payload, 'key', None))
+        if cls.LIST_KEY in payload:
+            meta = {key: value for key, value in payload.items() if key != cls.LIST_KEY}
+            return ModelList((cls._from_item(item) for item in payload[cls.LIST_KEY]), meta, cls.LIST_KEY)
+        return cls.from_dict(payload)
+
+    @classmethod
+    def _from_item(cls, item):
+        """一覧の要素をモデルに変換（モデルの場合はそのまま）"""
+        return item if isinstance(item, Model) else cls.from_dict(item)
+
+    @property
+    def extra(self):
+        """既知フィールド以外の値（参照のたびにデコード）"""
+        if self._extra is None:
+            return {}
+        return json_codec.loads(self._extra)
+
+    def _slot_items(self):
+        """設定済みのスロットの(名前, 値)"""
+        for name in self.FIELDS:
+            value = self._slot(name)
+            if value is not _MISSING:
+                yield name, value
+
+    def get(self, key, default=None):
+        """辞書と同様にフィールドの値を取得する（キーが存在しない場合のみdefault）"""
+        if key in self._field_set:
+            value = self._slot(key)
+            return default if value is _MISSING else value
+        return self.extra.get(key, default)
+
+    def _slot(self, name):
+        """スロットの値（未設定の場合は_MISSING。__getattr__を経由しない）"""
+        try:
+            return object.__getattribute__(self, name)
+        except AttributeError:
+            return _MISSING
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            value = self._slot(key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        return self.extra[key]
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return self._slot(key) is not _MISSING
+        return key in self.extra
+
+    def to_dict(self):
+        """辞書に変換（APIレスポンスと同じ形）"""
+        data = dict(self._slot_items())
+        data.update(self.extra)
+        return data
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={getattr(self, 'id', None)!r})"
+
+class ExTransaction(Model):
+    """経費明細"""
+
+    __slots__ = FIELDS = (
+        'id', 'office_member_id', 'recognized_at', 'value', 'remark', 'memo',
+        'currency', 'jpyrate', 'use_custom_jpy_rate', 'ex_item_id', 'dr_excise_id',
+        'dept_id', 'project_code_id', 'project_id', 'cr_item_id', 'cr_sub_item_id',
+        'ex_report_id', 'report_number', 'number', 'created_at', 'updated_at',
+    )
+    WRAPPER_KEY = 'ex_transaction'
+    LIST_KEY = 'ex_transactions'
+
+class ExReport(Model):
+    """経費申請"""
+
+    __slots__ = FIELDS = (
+        'id', 'number', 'title', 'ex_report_type_id', 'office_member_id', 'status',
+        'total_value', 'submitted_at', 'created_at', 'updated_at',
+    )
+    WRAPPER_KEY = 'ex_report'
+    LIST_KEY = 'ex_reports'
+
+class Office(Model):
+    """事業者"""
+
+    __slots__ = FIELDS = ('id', 'name', 'code')
+    WRAPPER_KEY = 'office'
+    LIST_KEY = 'offices'
+
+class ExReportType(Model):
+    """経費申請タイプ"""
+
+    __slots__ = FIELDS = ('id', 'name', 'code', 'description')
+    WRAPPER_KEY = 'ex_report_type'
+    LIST_KEY = 'ex_report_types'
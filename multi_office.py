@@ -0,0 +1,181 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import profiling
+from auth import MFAuth
+from api_client import MFExpenseClient
+from config import MF_OFFICES_FILE
+
+class RateLimiter:
+    """トークンバケット方式のレート制限（スレッドセーフ）"""
+
+    def __init__(self, rate, burst=None):
+        """
+        初期化
+
+        Args:
+            rate: 1秒あたりの最大リクエスト数（0以下の場合は無制限）
+            burst: バケット容量（指定しない場合はrateと同じ）
+        """
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """リクエスト枠を1つ取得する（枠が空くまで待機）"""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Office:
+    """事業者ごとの認証・クライアント・レート制限をまとめたクラス"""
+
+    def __init__(self, name, office_id, token_file, client_id=None, client_secret=None,
+                 rate_limit=0, max_workers=1, pool_size=None, template=None):
+        """
+        初期化
+
+        Args:
+            name: 事業者の識別名
+            office_id: 事業者ID
+            token_file: トークン保存先
+            client_id: クライアントID（指定しない場合は設定ファイルの値を使用）
+            client_secret: クライアントシークレット（指定しない場合は設定ファイルの値を使用）
+            rate_limit: 1秒あたりの最大リクエスト数（0の場合は無制限）
+            max_workers: 同時実行数
+            pool_size: コネクションプール数（指定しない場合はmax_workersと同じ）
+            template: 経費明細テンプレートJSONファイル
+        """
+        self.name = name
+        self.office_id = office_id
+        self.max_workers = max_workers
+        self.template = template
+        self.limiter = RateLimiter(rate_limit)
+        # 呼び出し元のスレッド数に関わらず、同時実行数をmax_workersに制限する（プロセス内）
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self.auth = MFAuth(
+            token_file=token_file,
+            client_id=client_id,
+            client_secret=client_secret,
+            pool_size=pool_size or max_workers
+        )
+        self.client = MFExpenseClient(self.auth, office_id=office_id)
+
+    def share_rate_limit(self, queue):
+        """
+        レート制限を作業キューのバックエンドで共有する（複数のワーカープロセス・ホストで1つの枠を使う）
+
+        Args:
+            queue: work_queue.QueueBackend
+        """
+        limiter = queue.rate_limiter(self.office_id, self.limiter.rate, self.limiter.capacity)
+        if limiter is not None:
+            self.limiter = limiter
+
+    def call(self, func, *args, **kwargs):
+        """同時実行数とレート制限を守ってfunc(client, ...)を実行する"""
+        with self._slots:
+            with profiling.span('rate_limit_wait', 'sched', office=self.name):
+                self.limiter.acquire()
+            return func(self.client, *args, **kwargs)
+
+def load_offices(path=None):
+    """
+    複数事業者設定ファイルを読み込む
+
+    設定ファイルの形式:
+        {"offices": [{"name": "hq", "office_id": "...", "token_file": "token_hq.json",
+                      "rate_limit": 3, "max_workers": 4}, ...]}
+
+    Args:
+        path: 設定ファイルのパス（指定しない場合は設定ファイルの値を使用）
+
+    Returns:
+        事業者名をキーとするOfficeの辞書
+    """
+    path = path or MF_OFFICES_FILE
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    offices = {}
+    for entry in config.get('offices', []):
+        name = entry['name']
+        if name in offices:
+            raise ValueError(f"事業者名が重複しています: {name}")
+        offices[name] = Office(
+            name=name,
+            office_id=entry['office_id'],
+            token_file=entry.get('token_file', f"token_{name}.json"),
+            client_id=entry.get('client_id'),
+            client_secret=entry.get('client_secret'),
+            rate_limit=entry.get('rate_limit', 0),
+            max_workers=entry.get('max_workers', 1),
+            pool_size=entry.get('pool_size'),
+            template=entry.get('template')
+        )
+    return offices
+
+class MultiOfficeRunner:
+    """複数事業者にまたがるバッチ処理を公平にスケジューリングするクラス
+
+    事業者ごとに専用のワーカーとレート制限を持つため、件数の多い事業者が
+    他の事業者の処理を妨げることはなく、全体のスループットは事業者数に比例する。
+    """
+
+    def __init__(self, offices):
+        """
+        初期化
+
+        Args:
+            offices: 事業者名をキーとするOfficeの辞書
+        """
+        self.offices = offices
+
+    def run(self, jobs):
+        """
+        事業者ごとのジョブを並行実行する
+
+        Args:
+            jobs: 事業者名をキー、(func, args)のリストを値とする辞書。
+                  funcはfunc(client, *args)の形で呼び出される
+
+        Returns:
+            事業者名をキー、(成功可否, 結果または例外)のリストを値とする辞書（jobsと同じ順序）
+        """
+        executors = {}
+        futures = {}
+        try:
+            for name, office_jobs in jobs.items():
+                office = self.offices[name]
+                executor = ThreadPoolExecutor(
+                    max_workers=office.max_workers,
+                    thread_name_prefix=f"office-{name}"
+                )
+                executors[name] = executor
+                futures[name] = [executor.submit(office.call, func, *args) for func, args in office_jobs]
+
+            results = {}
+            for name, office_futures in futures.items():
+                results[name] = []
+                for future in office_futures:
+                    try:
+                        results[name].append((True, future.result()))
+                    except Exception as e:
+                        results[name].append((False, e))
+            return results
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
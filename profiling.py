@@ -0,0 +1,248 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+class Tracer:
+    """Chrome/Perfetto形式（Trace Event Format）のトレースを記録するクラス"""
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._thread_names = {}
+        # プロセス間でトレースを結合できるよう、時刻はエポックからのマイクロ秒で記録する
+        self._epoch = time.time()
+        self._origin = time.perf_counter()
+
+    def now(self):
+        """現在時刻（エポックからのマイクロ秒）"""
+        return (self._epoch + time.perf_counter() - self._origin) * 1e6
+
+    def _tid(self):
+        thread = threading.current_thread()
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = thread.name
+        return tid
+
+    def complete(self, name, cat, start, end, args=None):
+        """開始・終了時刻が確定したスパンを記録"""
+        event = {
+            'name': name, 'cat': cat, 'ph': 'X',
+            'ts': start, 'dur': end - start,
+            'pid': self.pid, 'tid': self._tid(),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    def instant(self, name, cat, args=None):
+        """瞬間イベントを記録"""
+        event = {
+            'name': name, 'cat': cat, 'ph': 'i', 's': 't',
+            'ts': self.now(), 'pid': self.pid, 'tid': self._tid(),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    def extend(self, events):
+        """他のプロセスで記録したイベントを追加"""
+        with self._lock:
+            self.events.extend(events)
+
+    def to_dict(self):
+        """Trace Event Format の辞書に変換"""
+        metadata = [{
+            'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+            'args': {'name': name},
+        } for tid, name in self._thread_names.items()]
+        metadata.append({
+            'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0,
+            'args': {'name': os.path.basename(sys.argv[0]) or 'python'},
+        })
+        with self._lock:
+            return {'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path):
+        """トレースをJSONファイルに保存"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+_tracer = None
+_patches = []
+
+def get_tracer():
+    """有効なトレーサー（トレースが無効の場合はNone）"""
+    return _tracer
+
+@contextmanager
+def span(name, cat='app', **args):
+    """
+    処理時間をスパンとして記録するコンテキストマネージャ（トレースが無効の場合は何もしない）
+
+    Args:
+        name: スパン名
+        cat: カテゴリ
+        **args: スパンに付与するタグ。with内で辞書に値を追加することもできる
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield args
+        return
+    start = tracer.now()
+    try:
+        yield args
+    except BaseException as e:
+        args['error'] = repr(e)
+        raise
+    finally:
+        tracer.complete(name, cat, start, tracer.now(), args)
+
+def instant(name, cat='app', **args):
+    """瞬間イベントを記録（トレースが無効の場合は何もしない）"""
+    if _tracer is not None:
+        _tracer.instant(name, cat, args)
+
+def _wrap(owner, attribute, name):
+    """owner.attributeの関数呼び出しをスパンとして記録するよう差し替える"""
+    original = getattr(owner, attribute, None)
+    if original is None:
+        return False
+
+    def wrapper(*args, **kwargs):
+        with span(name, 'net'):
+            return original(*args, **kwargs)
+
+    setattr(owner, attribute, wrapper)
+    _patches.append((owner, attribute, original))
+    return True
+
+def _instrument_network():
+    """DNS・TCP接続・TLSハンドシェイクの時間を記録するようurllib3にフックする"""
+    try:
+        import urllib3.connection
+        import urllib3.util.connection
+    except ImportError:
+        return
+    _wrap(socket, 'getaddrinfo', 'dns')
+    _wrap(urllib3.util.connection, 'create_connection', 'connect')
+    # urllib3 2.x と 1.x で関数名が異なる
+    if not _wrap(urllib3.connection, '_ssl_wrap_socket_and_match_hostname', 'tls'):
+        _wrap(urllib3.connection, 'ssl_wrap_socket', 'tls')
+
+def start_trace():
+    """トレースの記録を開始"""
+    global _tracer
+    _tracer = Tracer()
+    _instrument_network()
+    return _tracer
+
+def stop_trace(path=None):
+    """
+    トレースの記録を終了
+
+    Args:
+        path: 保存先のJSONファイル（指定しない場合は保存しない）
+
+    Returns:
+        記録したトレーサー
+    """
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    while _patches:
+        owner, attribute, original = _patches.pop()
+        setattr(owner, attribute, original)
+    if tracer is not None and path:
+        tracer.save(path)
+    return tracer
+
+def load_trace_events(path):
+    """保存されたトレースファイルのイベントを読み込む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('traceEvents', [])
+
+class Profiler:
+    """全スレッドを対象にcProfileで計測するクラス"""
+
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+        self._main = cProfile.Profile()
+
+    def _start_thread(self, *args):
+        # 新しいスレッドの最初のイベントでそのスレッド用のプロファイラを開始する
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        """計測を開始"""
+        # Python 3.12以降のcProfileは全スレッドを計測するため、スレッドごとのプロファイラは不要
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread)
+        self._main.enable()
+
+    def stop(self):
+        """計測を終了"""
+        self._main.disable()
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+
+    def summary(self, sort='cumulative', limit=30):
+        """
+        計測結果の要約
+
+        Args:
+            sort: 並び順（pstatsのソートキー）
+            limit: 表示する関数の数
+
+        Returns:
+            要約の文字列
+        """
+        stream = io.StringIO()
+        stats = pstats.Stats(self._main, stream=stream)
+        with self._lock:
+            for profile in self.profiles:
+                try:
+                    stats.add(profile)
+                except TypeError:
+                    # 何も計測されなかったスレッド
+                    pass
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+@contextmanager
+def profile_and_trace(profile=False, trace_path=None):
+    """
+    --profile / --trace オプションに応じて計測・トレースを行うコンテキストマネージャ
+
+    Args:
+        profile: Trueの場合、cProfileの要約を標準エラー出力に表示
+        trace_path: トレースの保存先（指定しない場合はトレースしない）
+    """
+    profiler = Profiler() if profile else None
+    if trace_path:
+        start_trace()
+    if profiler:
+        profiler.start()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.stop()
+            print(profiler.summary(), file=sys.stderr)
+        if trace_path:
+            stop_trace(trace_path)
+            print(f"トレースを保存しました: {trace_path}", file=sys.stderr)
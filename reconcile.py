@@ -0,0 +1,264 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+import json_codec
+from models import ExTransaction
+
+# 明細を同一とみなすキーの既定値
+DEFAULT_KEY_FIELDS = ('recognized_at', 'ex_item_id', 'remark')
+
+# 内容比較の対象外とするフィールド
+IGNORED_FIELDS = frozenset(('id', 'created_at', 'updated_at', 'number'))
+
+def load_jsonl(path):
+    """
+    JSONLファイルから経費明細を読み込む
+
+    Args:
+        path: 1行に1件の経費明細（{"ex_transaction": {...}}または{...}）を記述したファイル
+
+    Returns:
+        経費明細データ（ex_transactionの中身）のリスト
+    """
+    transactions = []
+    with open(path, 'rb') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json_codec.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: JSONの形式が正しくありません: {e}")
+            transactions.append(record.get('ex_transaction', record))
+    return transactions
+
+def save_jsonl(path, transactions):
+    """経費明細をJSONLファイルに保存（ローカルミラー用）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for transaction in transactions:
+            f.write(json_codec.dumps(transaction))
+            f.write(b'\n')
+    os.replace(tmp_path, path)
+
+def fetch_current(client, per_page=100, since=None, until=None):
+    """
+    サーバー上の経費明細（自分の経費明細）を全ページ取得
+
+    Args:
+        client: MFExpenseClientインスタンス
+        per_page: 1ページあたりの件数
+        since: 計上日の開始日（YYYY-MM-DD）。指定した場合は一覧の検索条件に含める
+        until: 計上日の終了日（YYYY-MM-DD）。指定した場合は一覧の検索条件に含める
+
+    Returns:
+        経費明細データのリスト
+    """
+    query = {}
+    if since:
+        query['recognized_at_from'] = since
+    if until:
+        query['recognized_at_to'] = until
+
+    transactions = []
+    page = 1
+    while True:
+        items = ExTransaction.parse(client.get_ex_transactions(page=page, per_page=per_page, query=query))
+        transactions.extend(item.to_dict() for item in items)
+        if len(items) < per_page:
+            return transactions
+        page += 1
+
+def transaction_key(transaction, key_fields):
+    """明細を照合するためのキー"""
+    return tuple(transaction.get(field) for field in key_fields)
+
+def content_hash(transaction, fields):
+    """指定フィールドの内容のハッシュ"""
+    items = sorted((field, transaction.get(field)) for field in fields)
+    return hashlib.blake2b(repr(items).encode('utf-8'), digest_size=16).digest()
+
+def build_plan(desired, current, key_fields=DEFAULT_KEY_FIELDS, since=None, until=None, delete=True):
+    """
+    理想状態と現在の状態の差分から必要な操作を求める
+
+    理想状態の各明細を現在のすべての明細とキーで照合し、内容のハッシュが異なるものだけを更新する。
+    同じキーの明細が複数ある場合は、内容が一致するものを先にすべて対応付けてから残りを更新に割り当てる。
+    対応付けられなかった現在の明細のうち、対象期間（since〜until、省略時は理想状態の日付範囲）内で
+    理想状態に含まれる経費科目（ex_item_id）のものは削除対象とする。
+    それ以外の経費科目の明細は削除しない。申請済み（ex_report_idあり）の明細は変更しない。
+
+    Args:
+        desired: 理想状態の経費明細データのリスト
+        current: 現在の経費明細データのリスト
+        key_fields: 照合キーとするフィールド
+        since: 削除の対象期間の開始日（YYYY-MM-DD）
+        until: 削除の対象期間の終了日（YYYY-MM-DD）
+        delete: Falseの場合は削除を行わない
+
+    Returns:
+        {"create": [data], "update": [(id, data, before)], "delete": [before],
+         "skipped": [申請済みのため更新しない明細], "unchanged": 件数,
+         "scope": {"since": 開始日, "until": 終了日, "ex_item_ids": [削除の対象とする経費科目ID]},
+         "out_of_scope": [経費科目が対象外のため削除しない明細]}
+    """
+    dates = [t.get('recognized_at') for t in desired if t.get('recognized_at')]
+    since = since or (min(dates) if dates else None)
+    until = until or (max(dates) if dates else None)
+    ex_item_ids = {t.get('ex_item_id') for t in desired}
+
+    current_by_key = {}
+    for transaction in current:
+        current_by_key.setdefault(transaction_key(transaction, key_fields), []).append(transaction)
+
+    desired_by_key = {}
+    for data in desired:
+        desired_by_key.setdefault(transaction_key(data, key_fields), []).append(data)
+
+    plan = {
+        'create': [], 'update': [], 'delete': [], 'skipped': [], 'unchanged': 0,
+        'scope': {'since': since, 'until': until, 'ex_item_ids': sorted(ex_item_ids, key=str)},
+        'out_of_scope': [],
+    }
+    for key, rows in desired_by_key.items():
+        candidates = current_by_key.get(key, [])
+
+        # 内容が一致する明細をすべて対応付けてから、残りを更新に割り当てる
+        unmatched = []
+        for data in rows:
+            fields = [field for field in data if field not in IGNORED_FIELDS]
+            desired_hash = content_hash(data, fields)
+            for i, candidate in enumerate(candidates):
+                if content_hash(candidate, fields) == desired_hash:
+                    candidates.pop(i)
+                    plan['unchanged'] += 1
+                    break
+            else:
+                unmatched.append(data)
+
+        for data in unmatched:
+            if not candidates:
+                plan['create'].append(data)
+                continue
+            before = candidates.pop(0)
+            if before.get('ex_report_id'):
+                plan['skipped'].append(before)
+            else:
+                plan['update'].append((before['id'], data, before))
+
+    if delete:
+        for candidates in current_by_key.values():
+            for transaction in candidates:
+                recognized_at = transaction.get('recognized_at') or ''
+                if since and recognized_at < since or until and recognized_at > until:
+                    continue
+                if transaction.get('ex_report_id'):
+                    continue
+                if transaction.get('ex_item_id') in ex_item_ids:
+                    plan['delete'].append(transaction)
+                else:
+                    plan['out_of_scope'].append(transaction)
+    return plan
+
+def print_plan(plan):
+    """差分を表示"""
+    for data in plan['create']:
+        print(f"+ create {data.get('recognized_at')} {data.get('remark')} value={data.get('value')}")
+    for transaction_id, data, before in plan['update']:
+        changes = ', '.join(
+            f"{field}: {before.get(field)!r} -> {value!r}"
+            for field, value in data.items()
+            if field not in IGNORED_FIELDS and before.get(field) != value
+        )
+        print(f"~ update {transaction_id} {data.get('recognized_at')} ({changes})")
+    for before in plan['delete']:
+        print(f"- delete {before.get('id')} {before.get('recognized_at')} {before.get('remark')}")
+    for before in plan['skipped']:
+        print(f"! skip {before.get('id')} {before.get('recognized_at')} (申請済みのため更新しません)")
+    scope = plan['scope']
+    if plan['delete'] or plan['out_of_scope']:
+        print(f"\n削除の対象: {scope['since'] or '-'}〜{scope['until'] or '-'}, "
+              f"経費科目ID: {', '.join(str(i) for i in scope['ex_item_ids']) or '-'}")
+    if plan['out_of_scope']:
+        print(f"削除の対象外: 上記以外の経費科目の明細{len(plan['out_of_scope'])}件は理想状態になくても削除しません")
+    print(f"\n作成: {len(plan['create'])}件, 更新: {len(plan['update'])}件, "
+          f"削除: {len(plan['delete'])}件, 変更なし: {plan['unchanged']}件, スキップ: {len(plan['skipped'])}件")
+
+def apply_plan(client, plan, workers=4, office=None):
+    """
+    差分の操作を並行して実行
+
+    Args:
+        client: MFExpenseClientインスタンス
+        plan: build_planの結果
+        workers: 同時実行数
+        office: multi_office.Office。指定した場合は事業者のクライアントとレート制限（Office.call）で実行する
+
+    Returns:
+        (成功した操作の結果のリスト, 失敗した操作の例外のリスト)
+        結果は(操作, 明細ID, 作成・更新後の明細データ)
+    """
+    def create(client, data):
+        result = ExTransaction.parse(client.create_ex_transaction({'ex_transaction': data}))
+        return ('create', result.id, result.to_dict())
+
+    def update(client, transaction_id, data):
+        result = ExTransaction.parse(client.update_ex_transaction(transaction_id, {'ex_transaction': data}))
+        return ('update', transaction_id, result.to_dict())
+
+    def delete(client, transaction_id):
+        client.delete_ex_transaction(transaction_id)
+        return ('delete', transaction_id, None)
+
+    def call(func, *args):
+        if office is not None:
+            return office.call(func, *args)
+        return func(client, *args)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as executor:
+        futures = [executor.submit(call, create, data) for data in plan['create']]
+        futures += [executor.submit(call, update, transaction_id, data) for transaction_id, data, _ in plan['update']]
+        futures += [executor.submit(call, delete, before['id']) for before in plan['delete']]
+
+        succeeded = []
+        failed = []
+        for future in futures:
+            try:
+                succeeded.append(future.result())
+            except Exception as e:
+                failed.append(e)
+    return succeeded, failed
+
+def apply_to_mirror(current, succeeded):
+    """実行結果をローカルミラーの明細データに反映"""
+    by_id = {transaction.get('id'): transaction for transaction in current}
+    for operation, transaction_id, data in succeeded:
+        if operation == 'delete':
+            by_id.pop(transaction_id, None)
+        else:
+            by_id[transaction_id] = data
+    return list(by_id.values())
+
+def enqueue_plan(queue, plan, office=None):
+    """
+    差分の操作を作業キューに登録（main.py workerで実行）
+
+    Args:
+        queue: work_queue.QueueBackend
+        plan: build_planの結果
+        office: 複数事業者設定ファイルの事業者名
+
+    Returns:
+        新たに登録した作業の件数
+    """
+    count = 0
+    for data in plan['create']:
+        count += queue.enqueue('create_ex_transaction', {'transaction_data': {'ex_transaction': data}}, office)
+    for transaction_id, data, _ in plan['update']:
+        count += queue.enqueue('update_ex_transaction', {
+            'transaction_id': transaction_id,
+            'transaction_data': {'ex_transaction': data},
+        }, office)
+    for before in plan['delete']:
+        count += queue.enqueue('delete_ex_transaction', {'transaction_id': before['id']}, office)
+    return count
@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import json_codec
+
+# 既定の可視性タイムアウト（秒）。この時間内に完了しなかった作業は他のワーカーが再取得できる
+DEFAULT_VISIBILITY_TIMEOUT = 60
+
+# 既定の最大試行回数
+DEFAULT_MAX_ATTEMPTS = 5
+
+class WorkItem:
+    """キューから取得した作業"""
+
+    __slots__ = ('id', 'kind', 'office', 'payload', 'attempts', 'lease_token')
+
+    def __init__(self, id, kind, office, payload, attempts, lease_token):
+        self.id = id
+        self.kind = kind
+        self.office = office
+        self.payload = payload
+        self.attempts = attempts
+        self.lease_token = lease_token
+
+    def __repr__(self):
+        return f"WorkItem(id={self.id!r}, kind={self.kind!r}, office={self.office!r})"
+
+def make_key(kind, payload, office=None):
+    """作業の重複登録を防ぐためのキー（内容のハッシュ）"""
+    # コーデックの違いでキーが変わらないよう、標準のjsonでキー順を揃えてエンコードする
+    canonical = json.dumps([kind, office, payload], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    return f"{kind}:{digest}"
+
+def default_worker_id():
+    """ホスト名とプロセスIDからワーカーIDを作成"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class QueueBackend:
+    """作業キューのバックエンドの基底クラス
+
+    別のストレージ（サーバー型DB等）を使う場合はこのクラスを継承してBACKENDSに登録する。
+    """
+
+    def enqueue(self, kind, payload, office=None, key=None):
+        """
+        作業を登録（同じキーの作業が登録済みの場合は何もしない）
+
+        Args:
+            kind: 作業の種類（worker.HANDLERSのキー）
+            payload: 作業のデータ
+            office: 複数事業者設定ファイルの事業者名（指定しない場合は既定の事業者）
+            key: 重複防止のキー（指定しない場合は内容のハッシュ）
+
+        Returns:
+            新たに登録した場合はTrue
+        """
+        raise NotImplementedError
+
+    def claim(self, worker_id, limit=1):
+        """未処理の作業を取得してリースする（WorkItemのリスト）"""
+        raise NotImplementedError
+
+    def extend(self, item):
+        """リースの期限を延長（リースを失っていた場合はFalse）"""
+        raise NotImplementedError
+
+    def complete(self, item, result):
+        """結果を記録（リースを失っていた場合は記録せずFalse）"""
+        raise NotImplementedError
+
+    def fail(self, item, error, retry=True):
+        """失敗を記録し、retryがTrueかつ試行回数が残っていれば再試行待ちに戻す（リースを失っていた場合はFalse）"""
+        raise NotImplementedError
+
+    def stats(self):
+        """状態ごとの件数（pending, leased, done, failed）"""
+        raise NotImplementedError
+
+    def is_drained(self):
+        """未処理・処理中の作業がないか"""
+        counts = self.stats()
+        return counts['pending'] == 0 and counts['leased'] == 0
+
+    def rate_limiter(self, name, rate, capacity):
+        """
+        キューを共有するすべてのワーカーで共有するレート制限
+
+        Args:
+            name: レート制限の識別名（事業者ID等）
+            rate: 1秒あたりの最大リクエスト数
+            capacity: バケット容量
+
+        Returns:
+            acquire()を持つレート制限（共有できないバックエンドの場合はNone）
+        """
+        return None
+
+    def close(self):
+        """接続を閉じる"""
+
+class SQLiteRateLimiter:
+    """SQLiteファイルに状態を保持するトークンバケット方式のレート制限
+
+    同じファイルを使う複数のプロセス・ホストで1つのバケットを共有する。
+    時刻はtime.time()を使うため、複数のホストで共有する場合はホストの時刻を同期しておくこと。
+    """
+
+    def __init__(self, path, name, rate, capacity):
+        self.path = path
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        # sqlite3の接続はスレッド間で共有できないため、スレッドごとに接続する
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return conn
+
+    def _take(self):
+        """枠を1つ取得できれば0、できなければ空くまでの秒数を返す"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limits WHERE name = ?", (self.name,)
+            ).fetchone()
+            tokens = self.capacity if row is None else min(
+                self.capacity, row[0] + max(now - row[1], 0) * self.rate
+            )
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            if tokens >= 1:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (self.name, tokens, now)
+            )
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire(self):
+        """リクエスト枠を1つ取得する（枠が空くまで待機）"""
+        if self.rate <= 0:
+            return
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+class SQLiteQueue(QueueBackend):
+    """SQLiteファイルを使った作業キュー
+
+    複数のプロセス（同じファイルを共有する複数のホスト）から同時に利用できる。
+    作業はリース付きで取得し、可視性タイムアウトまでに完了しなかった作業は再び取得可能になる。
+    結果はリースを保持しているワーカーだけが記録できるため、1つの作業の結果は1回だけ記録される。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS work_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            office TEXT,
+            payload BLOB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_token TEXT,
+            lease_expires REAL,
+            result BLOB,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS work_items_status ON work_items (status, lease_expires);
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, wal=True):
+        """
+        初期化
+
+        Args:
+            path: SQLiteファイルのパス
+            visibility_timeout: リースの有効期間（秒）
+            max_attempts: 最大試行回数
+            wal: WALモードを使用するか（ネットワークファイルシステム上で共有する場合はFalse）。
+                 WALモードはファイルに記録されるため、Falseの場合は明示的にDELETEモードに戻す
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self.conn.executescript(self.SCHEMA)
+
+    def enqueue(self, kind, payload, office=None, key=None):
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO work_items (key, kind, office, payload, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key or make_key(kind, payload, office), kind, office, json_codec.dumps(payload), now, now)
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, worker_id, limit=1):
+        now = time.time()
+        # BEGIN IMMEDIATEで書き込みロックを取り、複数のワーカーが同じ作業を取得しないようにする
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT id, kind, office, payload, attempts FROM work_items "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            items = []
+            for item_id, kind, office, payload, attempts in rows:
+                if attempts >= self.max_attempts:
+                    # リース切れのまま試行回数を使い切った作業
+                    self.conn.execute(
+                        "UPDATE work_items SET status = 'failed', lease_token = NULL, updated_at = ?, "
+                        "error = COALESCE(error, 'リースの期限切れで試行回数を超過しました') WHERE id = ?",
+                        (now, item_id)
+                    )
+                    continue
+                token = uuid.uuid4().hex
+                self.conn.execute(
+                    "UPDATE work_items SET status = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                    "lease_token = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, token, now + self.visibility_timeout, now, item_id)
+                )
+                items.append(WorkItem(item_id, kind, office, json_codec.loads(payload), attempts + 1, token))
+            self.conn.execute("COMMIT")
+            return items
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def extend(self, item):
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE work_items SET lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (now + self.visibility_timeout, now, item.id, item.lease_token)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, item, result):
+        cursor = self.conn.execute(
+            "UPDATE work_items SET status = 'done', result = ?, error = NULL, lease_token = NULL, "
+            "updated_at = ? WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (json_codec.dumps(result), time.time(), item.id, item.lease_token)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, item, error, retry=True):
+        status = 'pending' if retry and item.attempts < self.max_attempts else 'failed'
+        cursor = self.conn.execute(
+            "UPDATE work_items SET status = ?, error = ?, lease_token = NULL, lease_expires = NULL, "
+            "updated_at = ? WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (status, str(error), time.time(), item.id, item.lease_token)
+        )
+        return cursor.rowcount == 1
+
+    def stats(self):
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        now = time.time()
+        rows = self.conn.execute(
+            "SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'pending' ELSE status END, COUNT(*) "
+            "FROM work_items GROUP BY 1",
+            (now,)
+        ).fetchall()
+        for status, count in rows:
+            counts[status] = counts.get(status, 0) + count
+        return counts
+
+    def failures(self, limit=20):
+        """失敗した作業の(ID, 種類, 事業者, エラー)のリスト"""
+        return self.conn.execute(
+            "SELECT id, kind, office, error FROM work_items WHERE status = 'failed' ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+    def rate_limiter(self, name, rate, capacity):
+        return SQLiteRateLimiter(self.path, name, rate, capacity)
+
+    def close(self):
+        self.conn.close()
+
+# キューのバックエンド（"スキーム://パス"のスキームをキーとする）
+BACKENDS = {
+    'sqlite': SQLiteQueue,
+}
+
+def open_queue(url, **kwargs):
+    """
+    作業キューを開く
+
+    Args:
+        url: "sqlite:///queue.db"（相対パス）、"sqlite:////abs/queue.db"（絶対パス）形式のURL、
+             またはSQLiteファイルのパス
+        **kwargs: バックエンドに渡す引数（SQLiteQueueの場合はvisibility_timeout、max_attempts、wal）
+
+    Returns:
+        QueueBackend
+    """
+    scheme, separator, path = url.partition('://')
+    if not separator:
+        return SQLiteQueue(url, **kwargs)
+    if scheme not in BACKENDS:
+        raise ValueError(f"不明なキューのバックエンドです: {scheme}")
+    if scheme == 'sqlite':
+        path = path[1:]
+    return BACKENDS[scheme](path, **kwargs)
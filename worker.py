@@ -0,0 +1,150 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+import profiling
+from work_queue import DEFAULT_VISIBILITY_TIMEOUT
+
+# キューから実行できる作業の種類（MFExpenseClientのメソッド名。payloadはメソッドのキーワード引数）
+KINDS = frozenset((
+    'create_ex_transaction',
+    'create_ex_transaction_for_member',
+    'update_ex_transaction',
+    'delete_ex_transaction',
+    'create_ex_report',
+    'update_ex_report',
+    'delete_ex_report',
+))
+
+def execute(client, kind, payload):
+    """作業を実行（client.<kind>(**payload)を呼び出す）"""
+    if kind not in KINDS:
+        raise ValueError(f"不明な作業の種類です: {kind}")
+    return getattr(client, kind)(**payload)
+
+def is_retryable(error):
+    """再試行すべきエラーか（リクエスト内容に問題がある4xxは再試行しない）"""
+    if isinstance(error, ValueError):
+        return False
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return not (400 <= status < 500) or status in (401, 408, 429)
+    return True
+
+def format_stats(counts):
+    """キューの状態の表示用文字列"""
+    total = sum(counts.values())
+    finished = counts['done'] + counts['failed']
+    percent = finished / total * 100 if total else 100.0
+    return (f"{finished}/{total} ({percent:.1f}%) 完了: {counts['done']}, 失敗: {counts['failed']}, "
+            f"処理中: {counts['leased']}, 未処理: {counts['pending']}")
+
+def run_worker(queue, get_client, worker_id, concurrency=4, poll_interval=1.0,
+               exit_when_empty=False, max_items=None, offices=None):
+    """
+    キューから作業を取得して実行するワーカー
+
+    複数のプロセス・ホストで同時に実行できる。作業はリース付きで取得し、実行中はリースを延長する。
+    同時実行数に空きができるたびに新たな作業を取得するため、時間のかかる作業があっても他の作業は待たされない。
+    結果はリースを保持している場合のみ記録されるため、各作業の結果は1回だけ記録される。
+
+    Args:
+        queue: QueueBackend
+        get_client: 事業者の指定がない作業に使うMFExpenseClientを返す関数（該当する作業を実行する時点で呼び出す）
+        worker_id: ワーカーID
+        concurrency: 同時実行数
+        poll_interval: キューが空の場合の待機秒数
+        exit_when_empty: Trueの場合、未処理・処理中の作業がなくなったら終了
+        max_items: 処理する最大件数（指定しない場合は無制限）
+        offices: 作業に事業者名が指定されている場合に使うOfficeの辞書を返す関数
+
+    Returns:
+        (完了件数, 失敗件数)
+    """
+    done_count = 0
+    failed_count = 0
+    # リースの期限が切れる前に延長する
+    extend_interval = max(getattr(queue, 'visibility_timeout', DEFAULT_VISIBILITY_TIMEOUT) / 3, 0.1)
+
+    def process(item):
+        with profiling.span(f"work {item.kind}", 'worker', item=item.id, office=item.office, attempt=item.attempts):
+            if item.office:
+                return offices()[item.office].call(execute, item.kind, item.payload)
+            return execute(get_client(), item.kind, item.payload)
+
+    def record(item, future):
+        nonlocal done_count, failed_count
+        try:
+            recorded = queue.complete(item, future.result())
+            if recorded:
+                done_count += 1
+        except Exception as e:
+            recorded = queue.fail(item, e, retry=is_retryable(e))
+            if recorded:
+                failed_count += 1
+            print(f"[{worker_id}] 作業{item.id}の実行に失敗しました（{item.attempts}回目）: {e}")
+        if not recorded:
+            print(f"[{worker_id}] 作業{item.id}のリースの期限が切れたため、結果を記録しませんでした")
+
+    # 実行中の作業（リース延長の対象）。作業が1件完了するたびに空いた分だけ新たに取得する
+    running = {}
+    next_extend = time.monotonic() + extend_interval
+    finished_since_report = False
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='worker') as executor:
+        while True:
+            limit = concurrency - len(running)
+            if max_items is not None:
+                limit = min(limit, max_items - done_count - failed_count - len(running))
+            if limit > 0:
+                for item in queue.claim(worker_id, limit=limit):
+                    running[executor.submit(process, item)] = item
+
+            if not running:
+                if max_items is not None and done_count + failed_count >= max_items:
+                    break
+                if exit_when_empty and queue.is_drained():
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            finished, _ = wait(running, timeout=max(next_extend - time.monotonic(), 0),
+                               return_when=FIRST_COMPLETED)
+            for future in finished:
+                record(running.pop(future), future)
+                finished_since_report = True
+
+            # 実行中の作業はリースを延長する
+            if time.monotonic() >= next_extend:
+                for item in running.values():
+                    queue.extend(item)
+                next_extend = time.monotonic() + extend_interval
+                if finished_since_report:
+                    print(f"[{worker_id}] {format_stats(queue.stats())}")
+                    finished_since_report = False
+
+    print(f"[{worker_id}] {format_stats(queue.stats())}")
+    return done_count, failed_count
+
+def watch_progress(queue, interval=2.0):
+    """
+    キューの進捗を表示（intervalが0の場合は1回だけ表示）
+
+    Args:
+        queue: QueueBackend
+        interval: 更新間隔（秒）
+    """
+    previous = None
+    while True:
+        counts = queue.stats()
+        line = format_stats(counts)
+        finished = counts['done'] + counts['failed']
+        now = time.monotonic()
+        if previous is not None:
+            rate = (finished - previous[1]) / (now - previous[0])
+            remaining = counts['pending'] + counts['leased']
+            eta = f"{remaining / rate:.0f}秒" if rate > 0 else "-"
+            line += f" | {rate:.1f}件/秒, 残り約{eta}"
+        print(line, flush=True)
+        if not interval or (counts['pending'] == 0 and counts['leased'] == 0):
+            return counts
+        previous = (now, finished)
+        time.sleep(interval)